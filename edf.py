@@ -1,17 +1,52 @@
 import numpy as np
-from mne.io import read_raw_edf
+import pyedflib
+from functools import lru_cache
 from pathlib import Path
 import re
-from signals import SignalSegment
 from constants import CHANNELS_TO_KEEP
 
+# Factors to convert each physical dimension to volts
+_UNIT_SCALE = {"V": 1.0, "mV": 1e-3, "uV": 1e-6, "µV": 1e-6}
+
+_FILE_NAME_RE = re.compile(r"File Name: (\S+)")
+_START_TIME_RE = re.compile(r"Start Time: (\d+)\s+seconds")
+_END_TIME_RE = re.compile(r"End Time: (\d+)\s+seconds")
+
+
+@lru_cache(maxsize=32)
+def _parse_summary(summary_path: Path) -> dict[str, list[tuple[int, int]]]:
+    """
+    Parse a patient summary file once for all of its EDF files.
+
+    Args:
+        summary_path (Path): Path to the '<patient>-summary.txt' file.
+
+    Returns:
+        dict[str, list[tuple[int, int]]]: Seizure (start, end) times in
+        seconds for each EDF file name.
+    """
+    with open(summary_path, "r") as f:
+        content = f.read()
+
+    matches = list(_FILE_NAME_RE.finditer(content))
+    seizures = {}
+    for match, next_match in zip(matches, matches[1:] + [None]):
+        section = content[match.end() : next_match.start() if next_match else None]
+        starts = _START_TIME_RE.findall(section)
+        ends = _END_TIME_RE.findall(section)
+        seizures[match.group(1)] = [
+            (int(start), int(end)) for start, end in zip(starts, ends)
+        ]
+    return seizures
+
 
 class EDF:
     def __init__(self, path: Path | str, with_seizures: bool = False) -> None:
         if isinstance(path, str):
             path = Path(path)
         self.path = path
-        self.seizures: list[SignalSegment] = []
+        # Seizure (start, end) sample indices, with shape (n_seizures, 2)
+        self.seizures = np.empty((0, 2), dtype=np.int64)
 
         self._read()
 
@@ -19,14 +54,13 @@ class EDF:
             self._load_seizures()
 
     def _read(self) -> None:
-        with read_raw_edf(self.path, preload=False, verbose=False) as raw:
-            self.sample_rate = int(raw.info["sfreq"])
-            self.channel_names = raw.ch_names
-            if "T8-P8-0" in self.channel_names:
-                # Some files there are 2 'T8-P8'
-                self.channel_names[self.channel_names.index("T8-P8-0")] = "T8-P8"
-
-            idx_map = {v: i for i, v in enumerate(self.channel_names)}
+        with pyedflib.EdfReader(str(self.path)) as reader:
+            self.channel_names = reader.getSignalLabels()
+
+            # Some files have duplicated channels (e.g. 2 'T8-P8'), keep the first
+            idx_map = {}
+            for i, name in enumerate(self.channel_names):
+                idx_map.setdefault(name, i)
             indices = np.fromiter(
                 (idx_map[x] for x in CHANNELS_TO_KEEP if x in idx_map), dtype=int
             )
@@ -36,25 +70,130 @@ class EDF:
                     f"The following channels does not exist in '{self.path.name}': {set(CHANNELS_TO_KEEP) - set(self.channel_names)}"
                 )
 
-            self.data = np.take(raw.get_data(), indices, axis=0)
+            self.sample_rate = int(reader.getSampleFrequency(indices[0]))
+            self.n_samples = int(reader.getNSamples()[indices[0]])
+
+            # Only the header is read here, samples are loaded on demand
+            self._indices = indices
+
+            # Samples are read as raw digital values and converted to volts
+            # with a single per-channel gain and offset:
+            # physical = (digital - dig_min) * gain + phys_min
+            gains, offsets = [], []
+            for i in indices:
+                unit = _UNIT_SCALE.get(reader.getPhysicalDimension(i), 1.0)
+                phys_min = reader.getPhysicalMinimum(i)
+                dig_min = reader.getDigitalMinimum(i)
+                gain = (reader.getPhysicalMaximum(i) - phys_min) / (
+                    reader.getDigitalMaximum(i) - dig_min
+                )
+                gains.append(gain * unit)
+                offsets.append((phys_min - dig_min * gain) * unit)
+            self._gains = np.array(gains, dtype=np.float32)[:, np.newaxis]
+            self._offsets = np.array(offsets, dtype=np.float32)[:, np.newaxis]
 
     def _load_seizures(self) -> None:
         parent_folder = self.path.parent
         summary_path = next(parent_folder.glob("*summary.txt"))
-        with open(summary_path, "r") as f:
-            content = f.read()
-            _start = content.find(f"File Name: {self.path.name}")
-            _end = content.find("File Name", _start + 1)
-            content = content[_start:_end]
-            starts = re.findall(r"Start Time: (\d+)\sseconds", content)
-            ends = re.findall(r"End Time: (\d+)\sseconds", content)
-            seizures = [
-                SignalSegment(
-                    int(start) * self.sample_rate, int(end) * self.sample_rate
-                )
-                for start, end in zip(starts, ends)
-            ]
-            self.seizures = seizures
+        seizures = _parse_summary(summary_path).get(self.path.name, [])
+        self.seizures = (
+            np.array(seizures, dtype=np.int64).reshape(-1, 2) * self.sample_rate
+        )
+
+    def get_segment(self, start: int, stop: int) -> np.ndarray:
+        """
+        Read the kept channels between two sample indices.
+
+        Args:
+            start (int): Index of the first sample.
+            stop (int): Index after the last sample. Clipped to the recording
+                length, like a slice.
+
+        Returns:
+            np.ndarray: Segment with shape (n_channels, stop - start).
+        """
+        return self.get_segments([(start, stop)])[0]
+
+    def get_segments(self, ranges: list[tuple[int, int]]) -> list[np.ndarray]:
+        """
+        Read several (start, stop) sample ranges, opening the file only once.
+
+        Args:
+            ranges (list[tuple[int, int]]): Sample ranges to read.
+
+        Returns:
+            list[np.ndarray]: One segment of shape (n_channels, n_samples) per
+            range.
+        """
+        segments = []
+        with pyedflib.EdfReader(str(self.path)) as reader:
+            for start, stop in ranges:
+                start, n = self._clip(start, stop)
+
+                # float32 halves memory and bandwidth, EEG does not need float64
+                segment = np.empty((len(self._indices), n), dtype=np.float32)
+                for row, i in enumerate(self._indices):
+                    segment[row] = reader.readSignal(i, start, n, digital=True)
+                segment *= self._gains
+                segment += self._offsets
+                segments.append(segment)
+        return segments
+
+    def read_epochs(self, ranges: list[tuple[int, int]], epoch_size: int) -> np.ndarray:
+        """
+        Read several (start, stop) sample ranges split into epochs.
+
+        Equivalent to concatenating `get_epochs` over `get_segments(ranges)`,
+        but the samples are read straight into one preallocated array, so no
+        intermediate segment arrays are built and copied. Samples that do not
+        form a full epoch are neither read nor returned.
+
+        Args:
+            ranges (list[tuple[int, int]]): Sample ranges to read.
+            epoch_size (int): Number of samples in each epoch.
+
+        Returns:
+            np.ndarray: Epochs array with shape (n_epochs, n_channels,
+            epoch_size).
+        """
+        clipped = [self._clip(start, stop) for start, stop in ranges]
+        n_epochs = self.count_epochs(ranges, epoch_size)
+
+        epochs = np.empty(
+            (sum(n_epochs), len(self._indices), epoch_size), dtype=np.float32
+        )
+        offset = 0
+        with pyedflib.EdfReader(str(self.path)) as reader:
+            for (start, _), count in zip(clipped, n_epochs):
+                out = epochs[offset : offset + count]
+                for row, i in enumerate(self._indices):
+                    out[:, row] = reader.readSignal(
+                        i, start, count * epoch_size, digital=True
+                    ).reshape(count, epoch_size)
+                offset += count
+
+        epochs *= self._gains
+        epochs += self._offsets
+        return epochs
+
+    def count_epochs(self, ranges: list[tuple[int, int]], epoch_size: int) -> list[int]:
+        """
+        Count the complete epochs in each (start, stop) sample range, without
+        reading any samples.
+
+        Args:
+            ranges (list[tuple[int, int]]): Sample ranges.
+            epoch_size (int): Number of samples in each epoch.
+
+        Returns:
+            list[int]: Number of epochs `read_epochs` returns for each range.
+        """
+        return [self._clip(start, stop)[1] // epoch_size for start, stop in ranges]
+
+    def _clip(self, start: int, stop: int) -> tuple[int, int]:
+        """Clip a sample range to the recording like a slice, as (start, n)."""
+        start = min(max(start, 0), self.n_samples)
+        return start, max(min(stop, self.n_samples) - start, 0)
 
     def get_seizure_data(self) -> list[np.ndarray]:
-        return [self.data[:, seg.start : seg.end] for seg in self.seizures]
+        return self.get_segments(self.seizures.tolist())
@@ -44,4 +44,15 @@ class FeatureExtractor(ABC):
                     "'signals' must be a list of 2D numpy arrays or a 3D numpy array with shape (n_signals, n_channels, n_samples)."
                 )
 
-        return np.array([cls.extract(signal, sample_rate) for signal in signals])
+        if len(signals) == 0:
+            return np.array([])
+
+        # Preallocate the output from the first feature instead of building a
+        # list of features and copying it into a new array
+        first = cls.extract(signals[0], sample_rate)
+        features = np.empty((len(signals), *first.shape), dtype=first.dtype)
+        features[0] = first
+        for i in range(1, len(signals)):
+            features[i] = cls.extract(signals[i], sample_rate)
+
+        return features
@@ -1,22 +1,22 @@
 import logging
 import os
-import warnings
+from collections import Counter, defaultdict
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from multiprocessing import get_context
 from pathlib import Path
+import h5py
 import numpy as np
 from time import time
 from argparse import ArgumentParser
-from scipy.io import loadmat, savemat
+from scipy.io import savemat
 
 from constants import PATH_ROOT_DATASET
 from edf import EDF
-from signals import get_epochs, get_pre_ictal_segment
+from signals import get_pre_ictal_range
 from feature_extractor.covariance import CovarianceExtractor
 
-warnings.filterwarnings(
-    "ignore", message="Channel names are not unique*", category=RuntimeWarning
-)
-
 parser = ArgumentParser(description="EEG Feature Extraction")
 parser.add_argument(
     "--path",
@@ -49,11 +49,18 @@ parser.add_argument(
 parser.add_argument(
     "--output_type",
     "-t",
-    choices=["npz", "mat"],
+    choices=["npz", "mat", "h5"],
     help="Output file type (default: %(default)s)",
     type=str,
     default="npz",
 )
+parser.add_argument(
+    "--workers",
+    "-w",
+    help="Number of records processed in parallel (default: %(default)s)",
+    type=int,
+    default=max(1, (os.cpu_count() or 1) // 2),
+)
 
 args = parser.parse_args()
 DATASET_PATH = Path(args.path)
@@ -61,6 +68,7 @@ OFFSET_SECONDS = args.offset_seconds
 MULTIPLIER = args.multiplier
 EPOCH_DURATION = args.epoch_duration
 OUTPUT_TYPE = args.output_type
+WORKERS = args.workers
 
 with (DATASET_PATH / "RECORDS-WITH-SEIZURES").open() as f:
     RECORDS_WITH_SEIZURES = [line.strip() for line in f if line.strip()]
@@ -82,129 +90,183 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-# clean up all files in data folder
-for file in path_data.iterdir():
-    os.remove(file)
 
+def process_record(record: str) -> tuple[str, np.ndarray, np.ndarray] | None:
+    """
+    Extract the features and labels of a record.
+
+    Args:
+        record (str): Record path relative to the dataset root, as listed in
+            RECORDS-WITH-SEIZURES (e.g. 'chb01/chb01_03.edf').
+
+    Returns:
+        tuple[str, np.ndarray, np.ndarray] | None: Patient id, features and
+        labels, or None if the record is skipped.
+    """
+    patient = record.split("/")[0]
+    path_edf = DATASET_PATH / record
+
+    if not path_edf.exists():
+        logger.warning(f"'{path_edf}' does not exist. Skipping...")
+        return None
+
+    logger.info(f"PROCESSING {record}")
+
+    try:
+        edf = EDF(path_edf, with_seizures=True)
+    except Exception as e:
+        logging.error(e)
+        return None
+
+    if len(edf.seizures) == 0:
+        logger.info(f"{record} has no seizures. Skipping...")
+        return None
+
+    seizure_ranges = edf.seizures.tolist()
+    logger.info(f"{len(seizure_ranges)} seizure segments found.")
+
+    # Getting pre-ictal segments
+    pre_ictal_ranges = [
+        get_pre_ictal_range(
+            start,
+            end,
+            edf.sample_rate,
+            OFFSET_SECONDS,
+            MULTIPLIER,
+        )
+        for start, end in seizure_ranges
+    ]
 
-def main():
-    start_time = time()
-    for record in RECORDS_WITH_SEIZURES:
-        patient = record.split("/")[0]
-        out_patient_path = path_data / f"{patient}.{OUTPUT_TYPE}"
+    logger.info(f"{len(pre_ictal_ranges)} pre-ictal segments generated.")
 
-        path_edf = DATASET_PATH / record
+    # Count the epochs before reading, records without any are skipped
+    epoch_size = edf.sample_rate * EPOCH_DURATION
+    n_ictal = sum(edf.count_epochs(seizure_ranges, epoch_size))
+    n_pre_ictal = sum(edf.count_epochs(pre_ictal_ranges, epoch_size))
 
-        if not path_edf.exists():
-            logger.warning(f"'{path_edf}' does not exist. Skipping...")
-            continue
+    if n_pre_ictal == 0:
+        logger.warning(f"{record} has no pre-ictal epochs. Skipping...")
+        return None
+    elif n_ictal == 0:
+        logger.warning(f"{record} has no ictal epochs. Skipping...")
+        return None
 
-        logger.info(f"PROCESSING {record}")
+    # Ictal and pre-ictal epochs are read into a single array, ictal first,
+    # so the features and labels never need to be concatenated
+    epochs = edf.read_epochs(seizure_ranges + pre_ictal_ranges, epoch_size)
 
-        try:
-            edf = EDF(path_edf, with_seizures=True)
-        except Exception as e:
-            logging.error(e)
-            continue
-
-        if len(edf.seizures) == 0:
-            logger.info(f"{record} has no seizures. Skipping...")
-            continue
-
-        raw_seizures_data = edf.get_seizure_data()
-        logger.info(f"{len(raw_seizures_data)} seizure segments found.")
-
-        # Getting pre-ictal segments
-        raw_pre_ictal = [
-            get_pre_ictal_segment(
-                edf.data,
-                seg.start,
-                seg.end,
-                edf.sample_rate,
-                OFFSET_SECONDS,
-                MULTIPLIER,
-            )
-            for seg in edf.seizures
-        ]
-
-        logger.info(f"{len(raw_pre_ictal)} pre-ictal segments generated.")
-
-        # Get an array of epochs for ictal and pre-ictal
-        ictal_epochs = np.concatenate(
-            [
-                get_epochs(seg, edf.sample_rate, EPOCH_DURATION)
-                for seg in raw_seizures_data
-            ]
-        )
+    logger.info(f"{n_ictal} ictal epochs of shape {epochs[0].shape} generated.")
+
+    logger.info(f"{n_pre_ictal} pre-ictal epochs of shape {epochs[0].shape} generated.")
+
+    # Extracting features
+    features = CovarianceExtractor.extract_all(epochs)
+    logger.info(
+        f"Extracted {n_ictal} ictal features and {n_pre_ictal} pre-ictal features. The shape of each feature is {features[0].shape}"
+    )
+
+    labels = np.zeros(len(features))
+    labels[:n_ictal] = 1
+
+    return patient, features, labels
 
-        pre_ictal_epochs = np.concatenate(
-            [get_epochs(seg, edf.sample_rate, EPOCH_DURATION) for seg in raw_pre_ictal]
-        )
 
-        if len(pre_ictal_epochs) == 0:
-            logger.warning(f"{record} has no pre-ictal epochs. Skipping...")
-            continue
-        elif len(ictal_epochs) == 0:
-            logger.warning(f"{record} has no ictal epochs. Skipping...")
-            continue
+def save_features(patient: str, features: np.ndarray, labels: np.ndarray) -> None:
+    """
+    Save the features and labels of all records of a patient.
 
+    Each patient file is written once, so it is never read back and rewritten.
+
+    Args:
+        patient (str): Patient id, used as the output file name.
+        features (np.ndarray): Features of shape (n_epochs, n_features, 1).
+        labels (np.ndarray): Labels of shape (n_epochs,).
+    """
+    out_patient_path = path_data / f"{patient}.{OUTPUT_TYPE}"
+
+    if OUTPUT_TYPE == "npz":
         logger.info(
-            f"{len(ictal_epochs)} ictal epochs of shape {ictal_epochs[0].shape} generated."
+            f"Saving features with shape {features.shape} and labels with shape {labels.shape} to '{out_patient_path}'"
         )
 
+        np.savez_compressed(
+            out_patient_path,
+            features=features,
+            labels=labels,
+        )
+    elif OUTPUT_TYPE == "mat":
         logger.info(
-            f"{len(pre_ictal_epochs)} pre-ictal epochs of shape {pre_ictal_epochs[0].shape} generated."
+            f"Saving features with shape {features.shape} and labels with shape {labels.shape} to '{out_patient_path}'"
         )
 
-        # Extracting features
-        ictal_features = CovarianceExtractor.extract_all(ictal_epochs)
-        pre_ictal_features = CovarianceExtractor.extract_all(pre_ictal_epochs)
+        savemat(
+            out_patient_path,
+            {
+                "features": features,
+                "labels": labels,
+            },
+        )
+    elif OUTPUT_TYPE == "h5":
         logger.info(
-            f"Extracted {len(ictal_features)} ictal features and {len(pre_ictal_features)} pre-ictal features. The shape of each feature is {ictal_features[0].shape}"
+            f"Saving features with shape {features.shape} and labels with shape {labels.shape} to '{out_patient_path}'"
         )
 
-        ictal_labels = np.ones(len(ictal_features))
-        pre_ictal_labels = np.zeros(len(pre_ictal_features))
-
-        features = np.concatenate([ictal_features, pre_ictal_features])
-        labels = np.concatenate([ictal_labels, pre_ictal_labels])
-
-        if OUTPUT_TYPE == "npz":
-            if out_patient_path.exists():
-                with np.load(out_patient_path) as old_data:
-                    old_features = old_data["features"]
-                    old_labels = old_data["labels"]
-                    features = np.concatenate([old_features, features])
-                    labels = np.concatenate([old_labels, labels])
-
-            logger.info(
-                f"Saving features with shape {features.shape} and labels with shape {labels.shape} to '{out_patient_path}'"
-            )
-
-            np.savez_compressed(
-                out_patient_path,
-                features=features,
-                labels=labels,
-            )
-        elif OUTPUT_TYPE == "mat":
-            if out_patient_path.exists():
-                old_data = loadmat(out_patient_path)
-                old_features = old_data["features"]
-                old_labels = np.squeeze(old_data["labels"])
-                features = np.concatenate([old_features, features])
-                labels = np.concatenate([old_labels, labels])
-
-            logger.info(
-                f"Saving features with shape {features.shape} and labels with shape {labels.shape} to '{out_patient_path}'"
-            )
-
-            savemat(
-                out_patient_path,
-                {
-                    "features": features,
-                    "labels": labels,
-                },
-            )
+        with h5py.File(out_patient_path, "w") as f:
+            f.create_dataset("features", data=features, compression="lzf")
+            f.create_dataset("labels", data=labels, compression="lzf")
+
+
+def save_patients(
+    results: Iterable[tuple[str, np.ndarray, np.ndarray] | None],
+) -> None:
+    """
+    Buffer the results of `process_record` and save each patient once.
+
+    Args:
+        results (Iterable[tuple[str, np.ndarray, np.ndarray] | None]): Results
+            of `process_record`, in the order of RECORDS_WITH_SEIZURES.
+    """
+    remaining = Counter(record.split("/")[0] for record in RECORDS_WITH_SEIZURES)
+    pending = defaultdict(list)
+    for record, result in zip(RECORDS_WITH_SEIZURES, results):
+        patient = record.split("/")[0]
+        remaining[patient] -= 1
+        if result is not None:
+            pending[patient].append(result[1:])
+
+        # Save once all records of the patient have been processed
+        if remaining[patient] == 0 and pending[patient]:
+            features, labels = zip(*pending.pop(patient))
+            save_features(patient, np.concatenate(features), np.concatenate(labels))
+
+
+def main():
+    # clean up all files in data folder
+    for file in path_data.iterdir():
+        os.remove(file)
+
+    start_time = time()
+    if WORKERS <= 1:
+        save_patients(map(process_record, RECORDS_WITH_SEIZURES))
+    else:
+        # Avoid oversubscription: BLAS in each worker process uses one thread,
+        # unless the user set these variables. The workers inherit them when
+        # spawned, before they import numpy, so they are only set meanwhile.
+        blas_vars = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+        added_vars = [var for var in blas_vars if var not in os.environ]
+        os.environ.update({var: "1" for var in added_vars})
+
+        # Records are processed in parallel, but results are consumed in order
+        # so that only the main process writes the output files.
+        try:
+            with ProcessPoolExecutor(
+                max_workers=WORKERS,
+                mp_context=get_context("spawn"),
+            ) as executor:
+                save_patients(executor.map(process_record, RECORDS_WITH_SEIZURES))
+        finally:
+            for var in added_vars:
+                del os.environ[var]
 
     elapsed_time = int(time() - start_time)
     hh, rest = divmod(elapsed_time, 3600)
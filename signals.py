@@ -1,18 +1,9 @@
-from dataclasses import dataclass
 import numpy as np
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-@dataclass
-class SignalSegment:
-    start: int
-    "Start index of the segment."
-    end: int
-    "End index of the segment."
-
-
 def get_pre_ictal_segment(
     signal: np.ndarray,
     start_idx: int,
@@ -56,6 +47,39 @@ def get_pre_ictal_segment(
     if signal.ndim != 2:
         raise ValueError("Signal must have shape (n_channels, n_samples)")
 
+    final_start, final_stop = get_pre_ictal_range(
+        start_idx, end_idx, sample_rate, offset_seconds, multiplier
+    )
+
+    return signal[:, final_start:final_stop]
+
+
+def get_pre_ictal_range(
+    start_idx: int,
+    end_idx: int,
+    sample_rate: int = 256,
+    offset_seconds: int = 60,
+    multiplier: int = 1,
+) -> tuple[int, int]:
+    """
+    Compute the sample range of the pre-ictal segment preceding an ictal event.
+
+    See `get_pre_ictal_segment` for how the window is defined. Computing
+    only the indices allows reading just this range from the recording.
+
+    Args:
+        start_idx (int): Sample index corresponding to the ictal onset.
+        end_idx (int): Sample index corresponding to the ictal end.
+        sample_rate (int, optional): Sampling rate in Hz. Defaults to 256.
+        offset_seconds (int, optional): Time gap (in seconds) between the
+            end of the pre-ictal segment and the ictal onset. Defaults to 60.
+        multiplier (int, optional): Factor used to scale the ictal duration
+            when defining the length of the pre-ictal segment. Defaults to 1.
+
+    Returns:
+        tuple[int, int]: Start and stop sample indices of the pre-ictal
+        segment, clipped to 0.
+    """
     L = end_idx - start_idx
     offset_samples = int(offset_seconds * sample_rate)
     stop_point = start_idx - offset_samples
@@ -64,7 +88,7 @@ def get_pre_ictal_segment(
     final_start = max(0, start_point)
     final_stop = max(0, stop_point)
 
-    return signal[:, final_start:final_stop]
+    return final_start, final_stop
 
 
 def get_epochs(
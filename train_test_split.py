@@ -1,4 +1,6 @@
+import h5py
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from typing import Tuple, List
 from pathlib import Path
 
@@ -10,11 +12,11 @@ def load_train_test_split(
     random_state: int = 42,
 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
     """
-    Splits dataset by patient (one .npz file per patient).
+    Splits dataset by patient (one .npz or .h5 file per patient).
 
     Args:
     data_dir : str
-        Path to directory containing .npz files.
+        Path to directory containing .npz or .h5 files.
     train_ratio : float
         Ratio of patient used for training (0 < train_ratio < 1).
     shuffle : bool
@@ -38,11 +40,11 @@ def load_train_test_split(
     if not (0 < train_ratio < 1):
         raise ValueError("train_ratio must be between 0 and 1")
 
-    files = [f for f in data_dir.iterdir() if f.suffix == ".npz"]
+    files = [f for f in data_dir.iterdir() if f.suffix in (".npz", ".h5")]
     files.sort()
 
     if len(files) == 0:
-        raise ValueError(f"No .npz files found in '{data_dir}'")
+        raise ValueError(f"No .npz or .h5 files found in '{data_dir}'")
 
     if shuffle:
         rng = np.random.default_rng(random_state)
@@ -56,12 +58,17 @@ def load_train_test_split(
     if len(train_files) == 0 or len(test_files) == 0:
         raise ValueError("No files found for training or testing")
 
-    def load_files(file_list: List[str]):
-        X_list, y_list = [], []
-        for fname in file_list:
-            data = np.load(fname)
-            X_list.append(data["features"])
-            y_list.append(data["labels"])
+    def load_file(fname: Path) -> Tuple[np.ndarray, np.ndarray]:
+        if fname.suffix == ".h5":
+            with h5py.File(fname, "r") as data:
+                return data["features"][:], data["labels"][:]
+        with np.load(fname) as data:
+            return data["features"], data["labels"]
+
+    def load_files(file_list: List[Path]):
+        # Decompression releases the GIL, so files are loaded in parallel
+        with ThreadPoolExecutor(max_workers=min(8, len(file_list))) as executor:
+            X_list, y_list = zip(*executor.map(load_file, file_list))
         return np.concatenate(X_list, axis=0), np.concatenate(y_list, axis=0)
 
     X_train, y_train = load_files(train_files)